@@ -8,14 +8,260 @@ copied from source2.
 from __future__ import annotations
 
 import argparse
+import errno
 import json
+import os
 import shutil
+import stat
+import subprocess
+from collections.abc import Callable, Collection, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # optional speedup
+    _json_loads = json.loads
 
-def merge_dirs(src1: Path, src2: Path, dst: Path, *, overwrite_dst: bool) -> tuple[int, int, int]:
+try:
+    import ijson
+except ImportError:  # optional speedup
+    ijson = None
+else:
+    if ijson.backend != "yajl2_c":
+        # The pure-Python backend is slower than a full json.loads.
+        ijson = None
+
+# Secondary files below TAR_SMALL_FILE_SIZE are batched through one tar pipe
+# once there are at least TAR_MIN_FILES of them.
+TAR_SMALL_FILE_SIZE = 1024 * 1024
+TAR_MIN_FILES = 100
+
+# File copies and unlinks are I/O-bound, so run more workers than CPUs.
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Buffer size for the userspace copy fallback.
+COPY_BUFSIZE = 4 * 1024 * 1024
+
+# Files at least this large get sequential-readahead and drop-cache hints.
+FADVISE_MIN_SIZE = 64 * 1024 * 1024
+
+
+def _in_kernel_copies() -> list[Callable[[int, int, int], int]]:
+    """Return the available in-kernel ``(src_fd, dst_fd, count)`` copy calls, best first."""
+    copies = []
+    if hasattr(os, "copy_file_range"):
+        copies.append(os.copy_file_range)
+    if hasattr(os, "sendfile"):
+        copies.append(lambda src_fd, dst_fd, count: os.sendfile(dst_fd, src_fd, None, count))
+    return copies
+
+
+_IN_KERNEL_COPIES = _in_kernel_copies()
+
+# Not available on Windows, where opening a named pipe does not block anyway.
+_O_NONBLOCK = getattr(os, "O_NONBLOCK", 0)
+
+# errnos meaning an in-kernel copy method cannot be used for this file pair;
+# any other OSError is a real failure and is raised.
+_COPY_UNSUPPORTED_ERRNOS = frozenset(
+    {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSOCK}
+)
+
+
+def _copy_fd_range(
+    copy_chunk: Callable[[int, int, int], int], src_fd: int, dst_fd: int, size: int
+) -> bool:
+    """Copy *src_fd* to *dst_fd* with *copy_chunk* until it reports EOF.
+
+    *size* is the ``fstat`` size and only sets the chunk size, since the file
+    may grow while it is copied. Returns False if nothing could be copied from
+    a file of non-zero *size*, i.e. the method does not work for this pair.
+    """
+    count = max(size, COPY_BUFSIZE)
+    if copy_chunk(src_fd, dst_fd, count) == 0:
+        return False
+    while copy_chunk(src_fd, dst_fd, count):
+        pass
+    return True
+
+
+def _copy_data(src: str | os.PathLike, dst: str | os.PathLike) -> None:
+    """Copy the contents of *src* to *dst*, like ``shutil.copyfile``.
+
+    Tries ``os.copy_file_range`` (reflink or in-kernel copy), then
+    ``os.sendfile``, so multi-GB weight shards are not bounced through a
+    userspace buffer. Falls back to a plain buffered copy if neither works.
+    Named pipes raise ``shutil.SpecialFileError`` instead of blocking.
+    """
+    # Open without blocking so a named pipe is caught by the fstat below
+    # instead of waiting for a writer.
+    with open(os.open(src, os.O_RDONLY | _O_NONBLOCK), "rb") as fsrc:
+        src_fd = fsrc.fileno()
+        st = os.fstat(src_fd)
+        if stat.S_ISFIFO(st.st_mode):
+            raise shutil.SpecialFileError(f"`{src}` is a named pipe")
+        if _O_NONBLOCK:
+            os.set_blocking(src_fd, True)
+        with open(dst, "wb") as fdst:
+            dst_fd = fdst.fileno()
+            size = st.st_size
+            fadvise = hasattr(os, "posix_fadvise") and size >= FADVISE_MIN_SIZE
+            if fadvise:
+                os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            # A zero size is an empty file or one generated on read (procfs),
+            # for which in-kernel copies return 0; a plain read handles both.
+            for copy_chunk in _IN_KERNEL_COPIES if size else ():
+                try:
+                    if _copy_fd_range(copy_chunk, src_fd, dst_fd, size):
+                        break
+                except OSError as exc:
+                    if exc.errno not in _COPY_UNSUPPORTED_ERRNOS:
+                        raise
+                # Unsupported here (e.g. EXDEV for copy_file_range across
+                # filesystems on older kernels), or the call copied nothing; some
+                # filesystems return 0 without copying. Restart with the next method.
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+            else:
+                shutil.copyfileobj(fsrc, fdst, COPY_BUFSIZE)
+            if fadvise:
+                # The source is not read again; free its pages for other work.
+                os.posix_fadvise(src_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def _copy_file(src: str | os.PathLike, dst: str | os.PathLike) -> None:
+    """Copy *src* to *dst* with metadata, like ``shutil.copy2``."""
+    _copy_data(src, dst)
+    shutil.copystat(src, dst)
+
+
+def _link_file(src: str | os.PathLike, dst: str | os.PathLike) -> None:
+    """Hard-link *src* to *dst*, copying instead when linking is not possible."""
+    try:
+        # Resolve first: os.link does not reliably follow symlinks on Linux,
+        # and snapshot_download trees are made of links into a blob cache.
+        os.link(os.path.realpath(src), dst)
+    except OSError:
+        # Cross-device (EXDEV) or a filesystem without hard links.
+        _copy_file(src, dst)
+
+
+def _tar_copy(src: Path, dst: Path, rel_paths: list[str]) -> bool:
+    """Copy *rel_paths* from *src* into *dst* through a ``tar | tar`` pipe.
+
+    Many small files cost one open/stat/close round each with per-file copies;
+    tar streams them in a single pass. Symlinks are dereferenced, and modes,
+    nanosecond mtimes (POSIX format) and xattrs are kept, matching
+    ``_copy_file``. Returns False if tar is missing or fails, after
+    removing anything it extracted so the caller can copy the files itself.
+    """
+    tar = shutil.which("tar")
+    if tar is None:
+        return False
+    pack = subprocess.Popen(
+        [
+            tar, "-C", os.fspath(src), "-h", "--format=posix", "--xattrs",
+            "--null", "-T", "-", "-cf", "-",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    unpack = subprocess.Popen(
+        [tar, "-C", os.fspath(dst), "--no-same-owner", "--xattrs", "-xpf", "-"],
+        stdin=pack.stdout,
+        stderr=subprocess.DEVNULL,
+    )
+    pack.stdout.close()
+    try:
+        pack.stdin.write(b"\0".join(os.fsencode(p) for p in rel_paths))
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            pack.stdin.close()
+        except BrokenPipeError:
+            pass
+    packed = pack.wait() == 0
+    if unpack.wait() == 0 and packed:
+        return True
+
+    # Partially extracted files may be read-only (-p), which would make the
+    # caller's reopen for writing fail; remove them instead.
+    for rel in rel_paths:
+        try:
+            os.unlink(os.path.join(dst, rel))
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def _walk(root: Path) -> Iterator[tuple[str, os.DirEntry]]:
+    """Yield ``(relative_path, entry)`` for everything under *root*.
+
+    Each directory is yielded before its contents. Uses ``os.scandir`` so
+    file-type checks come from the cached dirent instead of a separate ``stat``
+    per ``Path``, and relative paths are sliced off ``entry.path`` rather than
+    built with ``Path.relative_to``.
+    """
+    root_str = os.fspath(root)
+    prefix_len = len(os.path.join(root_str, ""))
+    stack = [root_str]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                yield entry.path[prefix_len:], entry
+                if entry.is_dir():
+                    stack.append(entry.path)
+
+
+def _remove_tree(root: Path) -> None:
+    """Delete *root* like ``shutil.rmtree``, unlinking files on a thread pool.
+
+    Symlinks are removed, never followed. Directories are removed afterwards,
+    deepest first.
+    """
+    if os.path.islink(root):
+        raise OSError(f"Cannot remove a symbolic link as a tree: {root}")
+    files: list[str] = []
+    dirs: list[str] = []
+    stack = [os.fspath(root)]
+    while stack:
+        path = stack.pop()
+        dirs.append(path)
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    files.append(entry.path)
+
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+        for _ in pool.map(os.unlink, files):
+            pass
+    # Each directory was listed before its subdirectories.
+    for path in reversed(dirs):
+        os.rmdir(path)
+
+
+def merge_dirs(
+    src1: Path,
+    src2: Path,
+    dst: Path,
+    *,
+    overwrite_dst: bool,
+    link: bool = False,
+    fast_copy: bool = False,
+) -> tuple[int, int, int]:
     """Merge *src1* and *src2* into *dst*.
 
+    With *link*, files are hard-linked instead of copied where the filesystem
+    allows it, so the merged tree shares storage with the sources. With
+    *fast_copy*, copies skip timestamps and permission bits (``copystat``) and
+    keep only file contents.
+
     Returns a tuple of:
     - files_from_src1
     - files_from_src2
@@ -29,35 +275,147 @@ def merge_dirs(src1: Path, src2: Path, dst: Path, *, overwrite_dst: bool) -> tup
             raise FileExistsError(
                 f"Destination already exists: {dst}. Use --overwrite-dst to replace it."
             )
-        shutil.rmtree(dst)
+        _remove_tree(dst)
 
-    shutil.copytree(src1, dst)
-
-    files_from_src1 = sum(1 for p in src1.rglob("*") if p.is_file())
     files_from_src2 = 0
     skipped_conflicts = 0
 
-    for path in src2.rglob("*"):
-        rel = path.relative_to(src2)
-        target = dst / rel
-        if path.is_dir():
-            target.mkdir(parents=True, exist_ok=True)
-            continue
-        if target.exists():
-            skipped_conflicts += 1
-            continue
-        target.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(path, target)
-        files_from_src2 += 1
+    if link:
+        place_file = _link_file
+    elif fast_copy:
+        place_file = _copy_data
+    else:
+        place_file = _copy_file
+
+    dst.mkdir(parents=True)
+    src2_str = os.fspath(src2)
+    dst_str = os.fspath(dst)
+    with ThreadPoolExecutor(max_workers=IO_WORKERS) as pool:
+        # Directories are created inline (the walk yields them before their
+        # contents); only the file copies run on the pool.
+        futures = []
+        # Everything in dst so far, so secondary conflicts need no stat call
+        # and do not have to wait for the primary copies to land.
+        src1_paths: set[str] = set()
+        src1_dirs: list[tuple[str, str]] = [(os.fspath(src1), dst_str)]
+        for rel, entry in _walk(src1):
+            src1_paths.add(rel)
+            target = os.path.join(dst_str, rel)
+            if entry.is_dir():
+                os.mkdir(target)
+                src1_dirs.append((entry.path, target))
+                continue
+            futures.append(pool.submit(place_file, entry.path, target))
+        files_from_src1 = len(futures)
+
+        small_files: list[str] = []
+        for rel, entry in _walk(src2):
+            target = os.path.join(dst_str, rel)
+            if entry.is_dir():
+                # Its parent already exists (walk order), so a plain mkdir is
+                # enough, and directories shared with src1 need no syscall.
+                if rel not in src1_paths:
+                    os.mkdir(target)
+                continue
+            if rel in src1_paths:
+                skipped_conflicts += 1
+                continue
+            files_from_src2 += 1
+            # Links need no batching, and tar would restore the metadata that
+            # fast_copy is meant to skip. Special files go through place_file,
+            # which rejects named pipes instead of tar recreating them.
+            if (
+                not (link or fast_copy)
+                and entry.is_file()
+                and entry.stat().st_size < TAR_SMALL_FILE_SIZE
+            ):
+                small_files.append(rel)
+            else:
+                futures.append(pool.submit(place_file, entry.path, target))
+
+        if len(small_files) < TAR_MIN_FILES or not _tar_copy(src2, dst, small_files):
+            for rel in small_files:
+                futures.append(
+                    pool.submit(place_file, os.path.join(src2_str, rel), os.path.join(dst_str, rel))
+                )
+        for future in futures:
+            future.result()
+
+    if not fast_copy:
+        # Like shutil.copytree, keep the primary directories' metadata. This
+        # runs last because placing files updates directory mtimes.
+        for src_dir, dst_dir in src1_dirs:
+            shutil.copystat(src_dir, dst_dir)
 
     return files_from_src1, files_from_src2, skipped_conflicts
 
 
 def _read_json(path: Path) -> dict | None:
     try:
-        return json.loads(path.read_text(encoding="utf-8"))
-    except (json.JSONDecodeError, OSError):
+        return _json_loads(path.read_bytes())
+    except (ValueError, OSError):
+        return None
+
+
+def _scan_vocab_ids(ids: Iterable[object], limit: int) -> list[object]:
+    """Reduce *ids* to the max int id plus the non-int ids seen before it hit *limit*.
+
+    Once an int id ``>= limit`` has been seen the tokenizer is incompatible, so
+    later non-int ids are not kept for ``_max_token_id`` to coerce and cannot
+    turn that into "non-numeric". *ids* is still consumed to the end, so a
+    streamed file is fully parsed and fails the same way ``json.loads`` would.
+    """
+    kept: list[object] = []
+    max_id = None
+    for token_id in ids:
+        if type(token_id) is not int:
+            if max_id is None or max_id < limit:
+                kept.append(token_id)
+        elif max_id is None or token_id > max_id:
+            max_id = token_id
+    if max_id is not None:
+        kept.append(max_id)
+    return kept
+
+
+def _read_vocab_ids(tok_json_path: Path, limit: int) -> Collection[object] | None:
+    """Return the ids of ``model.vocab`` in *tok_json_path*, or None if unparsable.
+
+    The ids are reduced with ``_scan_vocab_ids``. With ijson available the file
+    is streamed, so memory stays constant instead of growing with the vocab;
+    otherwise it is parsed in one go. Both paths reach the same result.
+    """
+    if ijson is not None:
+        try:
+            with tok_json_path.open("rb") as fp:
+                return _scan_vocab_ids(
+                    (v for _, v in ijson.kvitems(fp, "model.vocab", use_float=True)), limit
+                )
+        except (ijson.JSONError, OSError):
+            pass
+
+    tokenizer_data = _read_json(tok_json_path)
+    if tokenizer_data is None:
         return None
+    tok_vocab = tokenizer_data.get("model", {}).get("vocab", {})
+    if not isinstance(tok_vocab, dict):
+        return ()
+    return _scan_vocab_ids(tok_vocab.values(), limit)
+
+
+def _max_token_id(ids: Collection[object]) -> int:
+    """Return the largest id in *ids*, coercing non-int values with ``int()``.
+
+    Parsed vocab ids are normally plain ints, so try a C-level ``max`` first and
+    only fall back to per-item coercion when the result is not an int.
+    """
+    try:
+        max_id = max(ids)
+    except TypeError:
+        max_id = None
+    if type(max_id) is int:
+        return max_id
+    return max(int(v) for v in ids)
 
 
 def fix_incompatible_tokenizer(dst: Path) -> tuple[bool, str]:
@@ -72,20 +430,22 @@ def fix_incompatible_tokenizer(dst: Path) -> tuple[bool, str]:
         return False, "config.json or tokenizer.json not found"
 
     config = _read_json(config_path)
-    tokenizer_data = _read_json(tok_json_path)
-    if config is None or tokenizer_data is None:
+    if config is None:
         return False, "failed to parse config.json or tokenizer.json"
 
     vocab_size = config.get("vocab_size")
     if not isinstance(vocab_size, int) or vocab_size <= 0:
         return False, "config.vocab_size is missing or invalid"
 
-    tok_vocab = tokenizer_data.get("model", {}).get("vocab", {})
-    if not isinstance(tok_vocab, dict) or not tok_vocab:
+    vocab_ids = _read_vocab_ids(tok_json_path, vocab_size)
+    if vocab_ids is None:
+        return False, "failed to parse config.json or tokenizer.json"
+
+    if not vocab_ids:
         return False, "tokenizer vocab is missing or empty"
 
     try:
-        max_token_id = max(int(v) for v in tok_vocab.values())
+        max_token_id = _max_token_id(vocab_ids)
     except (TypeError, ValueError):
         return False, "tokenizer vocab ids are non-numeric"
 
@@ -93,7 +453,7 @@ def fix_incompatible_tokenizer(dst: Path) -> tuple[bool, str]:
         return False, "tokenizer ids fit config.vocab_size"
 
     tok_json_path.unlink()
-    return True, f"removed incompatible tokenizer.json (max token id {max_token_id} >= vocab_size {vocab_size})"
+    return True, f"removed incompatible tokenizer.json (token id {max_token_id} >= vocab_size {vocab_size})"
 
 
 def main() -> None:
@@ -106,13 +466,29 @@ def main() -> None:
         action="store_true",
         help="Overwrite destination directory if it already exists",
     )
+    parser.add_argument(
+        "--link",
+        action="store_true",
+        help="Hard-link files instead of copying them when on the same filesystem",
+    )
+    parser.add_argument(
+        "--fast-copy",
+        action="store_true",
+        help="Copy file contents only, without timestamps or permission bits",
+    )
     args = parser.parse_args()
 
     from_src1, from_src2, conflicts = merge_dirs(
-        args.src1, args.src2, args.dst, overwrite_dst=args.overwrite_dst
+        args.src1,
+        args.src2,
+        args.dst,
+        overwrite_dst=args.overwrite_dst,
+        link=args.link,
+        fast_copy=args.fast_copy,
     )
     removed, reason = fix_incompatible_tokenizer(args.dst)
-    total = sum(1 for p in args.dst.rglob("*") if p.is_file())
+    # dst starts empty, so every file in it came from one of the two sources.
+    total = from_src1 + from_src2 - removed
 
     print(f"Merged into {args.dst} ({total} files)")
     print(f"- copied from primary: {from_src1}")